@@ -2,15 +2,19 @@
 # Copyright (c) 2025 Sun Devil Rocketry
 
 import argparse
+import functools
+import itertools
 import json
+import math
 import os
+import pathlib
 import shlex
 import sys
 import time
 
 from prompt_toolkit import PromptSession
 from prompt_toolkit.completion import NestedCompleter
-from prompt_toolkit.history import InMemoryHistory
+from prompt_toolkit.history import FileHistory
 from serial import SerialException
 
 from SDECv2.BaseController import create_controllers, BaseController
@@ -34,25 +38,196 @@ COMMANDS = [
     "q"
 ]
 
+# Default file locations, resolved once against the project root so they
+# do not depend on the directory the CLI is started from
+ROOT_DIR = pathlib.Path(__file__).resolve().parent
+INPUT_DIR = ROOT_DIR / "a_input"
+OUTPUT_DIR = ROOT_DIR / "a_output"
+
+CONFIG_PATH = str(ROOT_DIR / "config.json")
+UPLOAD_PRESET_PATH = str(INPUT_DIR / "to_upload_preset.json")
+DOWNLOAD_PRESET_PATH = str(OUTPUT_DIR / "downloaded_preset.json")
+UPLOAD_LORA_PRESET_PATH = str(INPUT_DIR / "to_upload_lora_preset.json")
+DOWNLOAD_LORA_PRESET_PATH = str(OUTPUT_DIR / "downloaded_lora_preset.json")
+EXTRACT_PRESET_PATH = str(OUTPUT_DIR / "extracted_preset.json")
+EXTRACT_DATA_PATH = str(OUTPUT_DIR / "extracted_data.csv")
+
+HISTORY_PATH = os.path.expanduser("~/.sdec_history")
+HISTORY_LENGTH = 1000
+
+class BoundedFileHistory(FileHistory):
+    """
+    Command history persisted to a file. On load only the most recent entries
+    are kept and the file is trimmed to match, so it cannot grow across sessions.
+    A history file that cannot be read or written leaves history in memory only.
+    """
+    def __init__(self, filename, max_length: int):
+        super().__init__(filename)
+        self.max_length = max_length
+
+    def load_history_strings(self):
+        try:
+            # FileHistory yields the newest entries first
+            strings = list(itertools.islice(super().load_history_strings(), self.max_length + 1))
+        except OSError:
+            return []
+
+        if len(strings) > self.max_length:
+            strings = strings[:self.max_length]
+            self._rewrite(strings)
+
+        return strings
+
+    def store_string(self, string):
+        try:
+            super().store_string(string)
+        except OSError:
+            pass
+
+    def _rewrite(self, strings):
+        # Same entry format FileHistory reads back, oldest entry first
+        tmp_path = f"{self.filename}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                for string in reversed(strings):
+                    f.write("\n".encode("utf-8"))
+                    for line in string.split("\n"):
+                        f.write(f"+{line}\n".encode("utf-8"))
+
+            os.replace(tmp_path, self.filename)
+        except OSError:
+            pass
+
+def set_low_latency(serial_obj):
+    """
+    Ask the USB-serial driver to flush received bytes immediately instead of
+    waiting on its latency timer (16 ms by default on FTDI adapters).
+    Best effort, ports and platforms without support are left unchanged.
+    """
+    # pyserial only implements this on Linux (ASYNC_LOW_LATENCY), other POSIX
+    # backends raise NotImplementedError and Windows has no such method
+    try:
+        serial_obj.set_low_latency_mode(True)
+    except (AttributeError, NotImplementedError, OSError, ValueError):
+        pass
+
+def _parse_noargs(line) -> bool:
+    """
+    Returns True if a command line carries no arguments, without running it through shlex
+    """
+    return not line or line.isspace()
+
+class _NoExitParser(argparse.ArgumentParser):
+    """
+    ArgumentParser that raises argparse.ArgumentError instead of printing to
+    stderr and exiting, so commands can report bad input with their own usage
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("exit_on_error", False)
+        super().__init__(*args, **kwargs)
+
+    def error(self, message):
+        raise argparse.ArgumentError(None, message)
+
+    def exit(self, status=0, message=None):
+        # Reached after a subcommand prints its -h help
+        raise argparse.ArgumentError(None, message or "")
+
+def _build_sensor_poll_parser():
+    arg_parser = _NoExitParser(prog="sensor_poll", add_help=False)
+    group = arg_parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--timeout", type=int, help="Time in seconds to poll")
+    group.add_argument("--count", type=int, help="Number of sensor frames to poll")
+    arg_parser.add_argument("--rate", type=float, help="Maximum sensor frames per second to poll")
+
+    return arg_parser
+
+def _build_flash_parser():
+    arg_parser = _NoExitParser(prog="flash", add_help=False)
+    sub_parser = arg_parser.add_subparsers(dest="subcommand", required=True)
+
+    extract_parser = sub_parser.add_parser("extract")
+    extract_parser.add_argument("--store-preset", type=str, help="Path to store preset to")
+    extract_parser.add_argument("--store-data", type=str, help="Path to store data to")
+    extract_parser.add_argument("--no-store-preset", action="store_true", help="Disable storing preset to a file")
+    extract_parser.add_argument("--no-store-data", action="store_true", help="Disable storing flash data to a file")
+
+    return arg_parser
+
+def _build_preset_parser():
+    arg_parser = _NoExitParser(prog="preset", add_help=False)
+    sub_parser = arg_parser.add_subparsers(dest="subcommand", required=True)
+
+    upload_parser = sub_parser.add_parser("upload")
+    upload_parser.add_argument("path", 
+                               nargs="?", 
+                               default=UPLOAD_PRESET_PATH, 
+                               help="Path to the preset file")
+    
+    download_parser = sub_parser.add_parser("download")
+    download_parser.add_argument("path",
+                                 nargs="?",
+                                 default=DOWNLOAD_PRESET_PATH,
+                                 help="Path to store the downloaded preset")
+    
+    sub_parser.add_parser("verify")
+
+    return arg_parser
+
+def _build_lora_parser():
+    arg_parser = _NoExitParser(prog="lora", add_help=False)
+    sub_parser = arg_parser.add_subparsers(dest="command", required=True)
+    preset_parser = sub_parser.add_parser("preset")
+
+    preset_parser = preset_parser.add_subparsers(dest="subcommand", required=True)
+    
+    upload_parser = preset_parser.add_parser("upload")
+    upload_parser.add_argument("path", 
+                               nargs="?", 
+                               default=UPLOAD_LORA_PRESET_PATH, 
+                               help="Path to the LoRA preset file")
+    
+    download_parser = preset_parser.add_parser("download")
+    download_parser.add_argument("path",
+                                 nargs="?",
+                                 default=DOWNLOAD_LORA_PRESET_PATH,
+                                 help="Path to store the LoRA downloaded preset")
+
+    return arg_parser
+
+# Command parsers are built once and reused, parse_args does not mutate them
+SENSOR_POLL_PARSER = _build_sensor_poll_parser()
+FLASH_PARSER = _build_flash_parser()
+PRESET_PARSER = _build_preset_parser()
+LORA_PARSER = _build_lora_parser()
+
 class Cli:
     intro = "SDECv2 CLI"
     prompt = ">> "
 
-    # Global objects 
-    serial_connection = SerialObj()
-    appa_parser = Parser(
-        preset_config=create_configs.appa_preset_config(),
-        preset_data=None
-    )
-    sensor_sentry = SensorSentry(create_sensors.flight_computer_rev2_sensors())
-
     def __init__(self):
+        # Needed up front for the connect completer, the rest is built on first use
+        self.serial_connection = SerialObj()
+
+        # Command name -> bound do_* handler, resolved once instead of per command
+        self._handlers = {
+            name.removeprefix("do_"): getattr(self, name)
+            for name in dir(type(self)) if name.startswith("do_")
+        }
+
+        # Tracks the comport state, only changed by connect, disconnect and quit
+        self._is_open = False
+
+        # Per-sensor (prefix, suffix, zero line) strings, filled on first use.
+        # Sensor names and units never change, so frames only format the readout
+        self._sensor_formats = {}
+
         self.session = PromptSession(
-            history=InMemoryHistory(),
+            history=BoundedFileHistory(HISTORY_PATH, max_length=HISTORY_LENGTH),
             completer=NestedCompleter.from_nested_dict({
                 "help":          {cmd: None for cmd in COMMANDS},
                 "sensor_dump":   None,
-                "sensor_poll":   {"--timeout": None, "--count": None},
+                "sensor_poll":   {"--timeout": None, "--count": None, "--rate": None},
                 "flash":         {"extract": {"--store-preset": None, "--store-data": None, "--no-store-preset": None, "--no-store-data": None}},
                 "preset":        {"upload": None, "download": None, "verify": None},
                 "lora":          {"preset": {"upload": None, "download": None}},
@@ -71,8 +246,8 @@ class Cli:
         if use_config:
             print("Using user config")
 
-            if os.path.exists("config.json"):
-                with open("config.json", "r") as f:
+            if os.path.exists(CONFIG_PATH):
+                with open(CONFIG_PATH, "r") as f:
                     try:
                         config = json.load(f)
 
@@ -97,17 +272,52 @@ class Cli:
 
             if not line: continue
 
-            params = shlex.split(line)
-            cmd, arg = params[0], params[1:]
-            handler = getattr(self, f"do_{cmd}", None)
+            # Handlers parse their own arguments, only the command name is split off here
+            cmd, *arg = line.split(maxsplit=1)
+            handler = self._handlers.get(cmd)
 
             if handler is None:
                 print(f"Unkown command: {cmd!r} (type 'help' for a list)")
                 continue
 
-            result = handler(shlex.join(arg))
+            result = handler(arg[0] if arg else "")
             if result: break
 
+    @functools.cached_property
+    def appa_parser(self):
+        return Parser(
+            preset_config=create_configs.appa_preset_config(),
+            preset_data=None
+        )
+
+    @functools.cached_property
+    def sensor_sentry(self):
+        return SensorSentry(create_sensors.flight_computer_rev2_sensors())
+
+    def _format_sensor_frame(self, frame) -> str:
+        """
+        Formats one frame of sensor readouts as a single block of text, so a
+        frame costs one write to stdout instead of one print per sensor
+        """
+        sensor_formats = self._sensor_formats
+        lines = []
+        for sensor, readout in frame.items():
+            fmt = sensor_formats.get(sensor)
+            if fmt is None:
+                fmt = sensor_formats[sensor] = (
+                    f"{sensor.name}: ",
+                    f" {sensor.unit}",
+                    f"{sensor.name}: 0.0 {sensor.unit}"
+                )
+
+            prefix, suffix, zero_line = fmt
+            lines.append(prefix + format(readout, ".2f") + suffix if readout else zero_line)
+
+        if not lines:
+            return ""
+
+        return "\n".join(lines) + "\n"
+
     def do_help(self, line):
         """
             Lists available commands or show help for a sepecifc command
@@ -116,9 +326,9 @@ class Cli:
         Arguments:
             command The name of the command to show help for
         """  
-        params = shlex.split(line)
+        params = line.split()
         if params:
-            handler = getattr(self, f"do_{params[0]}", None)
+            handler = self._handlers.get(params[0])
             if handler and handler.__doc__:
                 print(handler.__doc__)
             else:
@@ -126,7 +336,7 @@ class Cli:
         else:
             print("Available commands:")
             for name in COMMANDS:
-                 handler = getattr(self, f"do_{name}", None)
+                 handler = self._handlers.get(name)
                  doc = (handler.__doc__ or "").strip().splitlines()[0] if handler else ""
                  print(f"   {name:<20} {doc}")
         
@@ -137,22 +347,17 @@ class Cli:
             sensor_dump
         """
 
-        if not self.serial_connection.serialObj.is_open: 
+        if not self._is_open:
             print("Error: No serial connection")
             return
 
-        params = shlex.split(line)
-        if len(params) != 0:
+        if not _parse_noargs(line):
             print("Usage: sensor_dump")
             return
         
         try:
             sensor_dump = self.sensor_sentry.dump(self.serial_connection)
-            for sensor, readout in sensor_dump.items():
-                if readout:
-                    print(f"{sensor.name}: {readout:.2f} {sensor.unit}")
-                else:
-                    print(f"{sensor.name}: 0.0 {sensor.unit}")
+            sys.stdout.write(self._format_sensor_frame(sensor_dump))
         except (SerialError, InvalidDataError) as e:
             print(f"Command failed: {e}")
 
@@ -162,46 +367,56 @@ class Cli:
         """
             Continues printing frames of all sensor data until timeout or count is reached
         Usage:
-            sensor_poll <--timeout> <time> | <--count> | <count>
+            sensor_poll <--timeout> <time> | <--count> | <count> [--rate <hz>]
         Arguments:
             timeout Time in seconds for poll to last
             count Integer of how many sensor frames to poll
+            rate Optional maximum number of frames to poll per second
         Notes:
             Must provide either a timeout or count
+            Without a rate, frames are polled as fast as the device answers
         """
 
         print("NOTE: Currently unsupported by v2.6.0 of Flight Computer Firmware")
 
-        if not self.serial_connection.serialObj.is_open: 
+        if not self._is_open:
             print("Error: No serial connection")
             return
 
-        arg_parser = argparse.ArgumentParser(prog="sensor_poll", add_help=False)
-        group = arg_parser.add_mutually_exclusive_group(required=True)
-        group.add_argument("--timeout", type=int, help="Time in seconds to poll")
-        group.add_argument("--count", type=int, help="Number of sensor frames to poll")
-        
         try:
-            args = arg_parser.parse_args(shlex.split(line))
-        except SystemExit:
-            print("Usage: sensor_poll <--timeout> <time> | <--count> <count>")
+            args = SENSOR_POLL_PARSER.parse_args(shlex.split(line))
+            if args.rate is not None and not 0 < args.rate < math.inf:
+                SENSOR_POLL_PARSER.error("--rate must be a positive number")
+        except argparse.ArgumentError:
+            print("Usage: sensor_poll <--timeout> <time> | <--count> <count> [--rate <hz>]")
             return
 
+        if args.count is not None:
+            poll_args = {"count": args.count}
+        else:
+            poll_args = {"timeout": args.timeout}
+
+        period = 1 / args.rate if args.rate else 0
+
         try: 
-            if args.count is not None:
-                for sensor_poll in self.sensor_sentry.poll(self.serial_connection, count=args.count):
-                    for sensor, readout in sensor_poll.items():
-                        if readout:
-                            print(f"{sensor.name}: {readout:.2f} {sensor.unit}")
-                        else:
-                            print(f"{sensor.name}: 0.0 {sensor.unit}")
-            elif args.timeout is not None:
-                for sensor_poll in self.sensor_sentry.poll(self.serial_connection, timeout=args.timeout):
-                    for sensor, readout in sensor_poll.items():
-                        if readout:
-                            print(f"{sensor.name}: {readout:.2f} {sensor.unit}")
-                        else:
-                            print(f"{sensor.name}: 0.0 {sensor.unit}")
+            deadline = time.monotonic()
+            frames = 0
+            for sensor_poll in self.sensor_sentry.poll(self.serial_connection, **poll_args):
+                sys.stdout.write(self._format_sensor_frame(sensor_poll))
+                frames += 1
+
+                # Sleep off the rest of the frame period instead of polling faster than requested.
+                # The poll always runs to completion so it can finish its exchange with the device,
+                # only the sleep after the final counted frame is skipped
+                if not period or frames == args.count:
+                    continue
+
+                deadline += period
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    deadline = time.monotonic()
         except (SerialError, InvalidDataError) as e:
             print(f"Command failed: {e}")
 
@@ -219,31 +434,22 @@ class Cli:
                 --no-store-preset Optional flag to not store the preset to a file (default: True)
                 --no-store-data Optional flag to not store the flash data to a file (default: True)
         """
-        arg_parser = argparse.ArgumentParser(prog="flash", add_help=False)
-        sub_parser = arg_parser.add_subparsers(dest="subcommand", required=True)
-
-        extract_parser = sub_parser.add_parser("extract")
-        extract_parser.add_argument("--store-preset", type=str, help="Path to store preset to")
-        extract_parser.add_argument("--store-data", type=str, help="Path to store data to")
-        extract_parser.add_argument("--no-store-preset", action="store_true", help="Disable storing preset to a file")
-        extract_parser.add_argument("--no-store-data", action="store_true", help="Disable storing flash data to a file")
-
         try: 
-            args = arg_parser.parse_args(shlex.split(line))
-        except SystemExit:
+            args = FLASH_PARSER.parse_args(shlex.split(line))
+        except argparse.ArgumentError:
             print("Usage:\n" + 
                   "  flash_extract [--store-preset] [--store-data]"
             )
             return
         
-        if not self.serial_connection.serialObj.is_open: 
+        if not self._is_open:
             print("Error: No serial connection")
             return
         
         match args.subcommand:
             case "extract":
-                preset_path = "a_output/extracted_preset.json"
-                data_path = "a_output/extracted_data.csv"
+                preset_path = EXTRACT_PRESET_PATH
+                data_path = EXTRACT_DATA_PATH
                 
                 if args.store_preset: preset_path = args.store_preset
                 if args.store_data: data_path = args.store_data
@@ -280,26 +486,9 @@ class Cli:
                 path Option Path to store the downloaded preset file
         """
         
-        arg_parser = argparse.ArgumentParser(prog="preset", add_help=False)
-        sub_parser = arg_parser.add_subparsers(dest="subcommand", required=True)
-
-        upload_parser = sub_parser.add_parser("upload")
-        upload_parser.add_argument("path", 
-                                   nargs="?", 
-                                   default="a_input/to_upload_preset.json", 
-                                   help="Path to the preset file")
-        
-        download_parser = sub_parser.add_parser("download")
-        download_parser.add_argument("path",
-                                     nargs="?",
-                                     default="a_output/downloaded_preset.json",
-                                     help="Path to store the downloaded preset")
-        
-        verify_parser = sub_parser.add_parser("verify")
-
         try:
-            args = arg_parser.parse_args(shlex.split(line))
-        except SystemExit:
+            args = PRESET_PARSER.parse_args(shlex.split(line))
+        except argparse.ArgumentError:
             print("Usage:\n" +
                     "  preset upload [path]\n" +
                     "  preset download [path]\n" +
@@ -307,7 +496,7 @@ class Cli:
             )
             return
         
-        if not self.serial_connection.serialObj.is_open: 
+        if not self._is_open:
             print("Error: No serial connection")
             return
 
@@ -337,12 +526,11 @@ class Cli:
             dashboard_dump 
         """
 
-        if not self.serial_connection.serialObj.is_open: 
+        if not self._is_open:
             print("Error: No serial connection")
             return
 
-        params = shlex.split(line)
-        if len(params) != 0:
+        if not _parse_noargs(line):
             print("Usage: dashboard_dump")
             return
         
@@ -355,11 +543,12 @@ class Cli:
             print("Dashboard dump not found.")
             return
 
-        for sensor, readout in dashboard_dump.items():
-            if readout is not None:
-                print(f"{sensor}: {readout:.2f}")
-            else:
-                print(f"{sensor}: 0.0")
+        lines = [
+            f"{sensor}: {readout:.2f}" if readout is not None else f"{sensor}: 0.0"
+            for sensor, readout in dashboard_dump.items()
+        ]
+        if lines:
+            sys.stdout.write("\n".join(lines) + "\n")
 
         self.serial_connection.reset_input_buffer()
 
@@ -370,8 +559,7 @@ class Cli:
             list_comports
         """
         
-        params = shlex.split(line)
-        if len(params) != 0:
+        if not _parse_noargs(line):
             print("Usage: list_comports")
             return
         
@@ -398,7 +586,7 @@ class Cli:
         """
         should_close = False
 
-        params = shlex.split(line)
+        params = line.split()
         if len(params) == 1:
             name = params[0]
             timeout = 1
@@ -421,11 +609,14 @@ class Cli:
         )
 
         try:
-            if self.serial_connection.open_comport():
+            self._is_open = self.serial_connection.open_comport()
+            if self._is_open:
                 print(f"Successfully opened serial connection on port {name}")
+                set_low_latency(self.serial_connection.serialObj)
             else:
                 print(f"Failed to open serial connection on port {name}")
-        except ComportError as e:
+        except (ComportError, OSError) as e:
+            self._is_open = False
             print(f"Failed to open serial connection on port {name}: {e}")
             return
 
@@ -453,6 +644,7 @@ class Cli:
         finally:
             if should_close:
                 if self.serial_connection.close_comport():
+                    self._is_open = False
                     print(f"Successfully closed serial connection on port {self.serial_connection.comport.name}")
                 else:
                     print(f"Failed to close serial connection on port {self.serial_connection.comport.name}")
@@ -464,8 +656,7 @@ class Cli:
             disconnect
         """
 
-        params = shlex.split(line)
-        if len(params) != 0:
+        if not _parse_noargs(line):
             print("Usage: disconnect")
             return
         
@@ -479,6 +670,7 @@ class Cli:
 
         try:
             if self.serial_connection.close_comport():
+                self._is_open = False
                 print(f"Successfully closed serial connection on port {self.serial_connection.comport.name}")
             else:
                 print(f"Failed to close serial connection on port {self.serial_connection.comport.name}")
@@ -498,34 +690,16 @@ class Cli:
                 path Option Path to store the downloaded preset file        
         """
 
-        arg_parser = argparse.ArgumentParser(prog="lora", add_help=False)
-        sub_parser = arg_parser.add_subparsers(dest="command", required=True)
-        preset_parser = sub_parser.add_parser("preset")
-
-        preset_parser = preset_parser.add_subparsers(dest="subcommand", required=True)
-        
-        upload_parser = preset_parser.add_parser("upload")
-        upload_parser.add_argument("path", 
-                                   nargs="?", 
-                                   default="a_input/to_upload_lora_preset.json", 
-                                   help="Path to the LoRA preset file")
-        
-        download_parser = preset_parser.add_parser("download")
-        download_parser.add_argument("path",
-                                     nargs="?",
-                                     default="a_output/downloaded_lora_preset.json",
-                                     help="Path to store the LoRA downloaded preset")
-
         try:
-            args = arg_parser.parse_args(shlex.split(line))
-        except SystemExit:
+            args = LORA_PARSER.parse_args(shlex.split(line))
+        except argparse.ArgumentError:
             print("Usage:\n" +
                     "  lora preset upload [path]\n" +
                     "  lora preset download [path]\n"
             )
             return
         
-        if not self.serial_connection.serialObj.is_open: 
+        if not self._is_open:
             print("Error: No serial connection")
             return
 
@@ -551,9 +725,13 @@ class Cli:
         """
         try:
             self.serial_connection.close_comport()
-        except:
+        except (SDECError, OSError, AttributeError):
+            # Nothing to close or the port already went away (pyserial's SerialException
+            # is an OSError), quit regardless
             pass
 
+        self._is_open = False
+
         return True
     
     def do_q(self, line):